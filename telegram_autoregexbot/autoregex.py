@@ -1,22 +1,37 @@
 import asyncio
 import configparser
+import errno
+import functools
+import heapq
 import html
+import io
+import itertools
 import logging
 import os
+import random
 import re
 import sqlite3
 import sys
+import tempfile
+import threading
 import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from importlib import metadata
-from typing import List, Tuple
+from typing import Literal, NamedTuple
 from zoneinfo import ZoneInfo
 
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
 # Third-party imports
 import httpx
 from telegram import BotCommand, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.constants import ChatType, ParseMode
-from telegram.error import NetworkError, TimedOut
+from telegram.error import NetworkError, RetryAfter, TimedOut
 from telegram.ext import (
     Application,
     CallbackQueryHandler,
@@ -28,13 +43,75 @@ from telegram.ext import (
 from telegram.request import HTTPXRequest
 
 # --- Logging Configuration ---
+# Libraries log at WARNING and up; only the bot's own logger emits INFO
 logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.WARNING
 )
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Patterns used by the handlers, compiled once
+_URL_RE = re.compile(r"https?://\S+")
+_REASON_RE = re.compile(r"\((.*)\)")
+_DURATION_RE = re.compile(r"(\d+)\s*([smhd])", re.IGNORECASE)
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+# Dynamic callback data: set:<section|rule|delrule>:<key> and rem:del:<id>
+_SETTING_CALLBACK_RE = re.compile(r"set:([^:]+):(.+)")
+_REMINDER_DELETE_RE = re.compile(r"rem:del:(\d+)")
+
+# Reminder times are shown in IST; Telegram doesn't tell us the user's timezone
+_IST = ZoneInfo("Asia/Kolkata")
+_TIME_FMT = "%Y-%m-%d %H:%M:%S"
+_SHORT_TIME_FMT = "%d/%m %H:%M"
+
+# Backreferences (\1, (?P=name), (?(1)...)) are renumbered inside an alternation
+_BACKREF_RE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+_INLINE_FLAGS = ((re.IGNORECASE, "i"), (re.MULTILINE, "m"), (re.DOTALL, "s"))
+
+
+_REPEAT_OPS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+
+def _literal_chars(parsed):
+    """Yields the literal characters of a parsed pattern in order, and None wherever a run breaks."""
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            yield chr(av)
+        elif op == sre_parse.SUBPATTERN:
+            yield from _literal_chars(av[-1])
+        elif op in _REPEAT_OPS and av[0] >= 1:
+            # A body repeated at least once must appear, but not next to its neighbours
+            yield None
+            yield from _literal_chars(av[2])
+            yield None
+        else:
+            yield None
 
-# Silence httpx logs
-logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def required_literal(pattern: re.Pattern, min_length=3):
+    """Returns a casefolded substring every match of pattern must contain, or None if there is none."""
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except re.error:
+        return None
+
+    # sre folds non-ASCII case its own way ("ı" matches "i"), which str.casefold doesn't
+    # reproduce; for case-insensitive patterns only ASCII characters are safe to require
+    ascii_only = bool(pattern.flags & re.IGNORECASE)
+
+    best = ""
+    run = []
+    for char in _literal_chars(parsed):
+        if char is not None and not (ascii_only and not char.isascii()):
+            run.append(char)
+            continue
+        if len(run) > len(best):
+            best = "".join(run)
+        run = []
+    if len(run) > len(best):
+        best = "".join(run)
+
+    return best.casefold() if len(best) >= min_length else None
 
 # --- Database Management ---
 
@@ -44,11 +121,21 @@ class DatabaseManager:
         if db_path is None:
             db_path = os.environ.get("DB_PATH", "reminders.db")
         self.db_path = db_path
+
+        # One long-lived connection in autocommit mode, shared by all callers
+        self._conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # sqlite3 connections aren't safe for concurrent use across threads
+        self._lock = threading.Lock()
         self._init_db()
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
+        with self._lock:
+            self._conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS reminders (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -62,7 +149,7 @@ class DatabaseManager:
                 )
                 """
             )
-            conn.execute(
+            self._conn.execute(
                 """
                 CREATE TABLE IF NOT EXISTS state (
                     key TEXT PRIMARY KEY,
@@ -70,71 +157,144 @@ class DatabaseManager:
                 )
                 """
             )
-            conn.commit()
+            # Unix time of remind_time, so reads skip the ISO string parse
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(reminders)")}
+            if "remind_epoch" not in columns:
+                self._conn.execute("ALTER TABLE reminders ADD COLUMN remind_epoch REAL")
+            self._backfill_epochs()
+            # Serves the per-user and per-chat listings, already ordered by time
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_reminders_chat_user "
+                "ON reminders (chat_id, user_id, remind_time)"
+            )
+
+    def _backfill_epochs(self):
+        # Rows written before remind_epoch existed; naive times were stored as UTC
+        rows = self._conn.execute(
+            "SELECT id, remind_time FROM reminders WHERE remind_epoch IS NULL"
+        ).fetchall()
+        if not rows:
+            return
+        updates = []
+        for row in rows:
+            try:
+                remind_time = datetime.fromisoformat(row["remind_time"])
+            except (TypeError, ValueError) as e:
+                # Its epoch stays NULL, which keeps it out of every read below
+                logger.error(f"Skipping reminder {row['id']} with unreadable time: {e}")
+                continue
+            if remind_time.tzinfo is None:
+                remind_time = remind_time.replace(tzinfo=timezone.utc)
+            updates.append((remind_time.timestamp(), row["id"]))
+        if not updates:
+            return
+        # Autocommit connection: open the transaction by hand, and never leave it open
+        self._conn.execute("BEGIN")
+        try:
+            self._conn.executemany("UPDATE reminders SET remind_epoch = ? WHERE id = ?", updates)
+        except sqlite3.Error:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
 
     def set_state(self, key, value):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
+        with self._lock:
+            self._conn.execute(
                 "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
                 (key, str(value)),
             )
-            conn.commit()
 
     def get_state(self, key):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.execute("SELECT value FROM state WHERE key = ?", (key,))
+        with self._lock:
+            cursor = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,))
             row = cursor.fetchone()
             return row[0] if row else None
 
     def clear_state(self, key):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM state WHERE key = ?", (key,))
-            conn.commit()
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
 
     def add_reminder(self, chat_id, user_id, user_name, message_id, remind_time, reason, link):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
+        with self._lock:
+            cursor = self._conn.execute(
                 """
-                INSERT INTO reminders (chat_id, user_id, user_name, message_id, remind_time, reason, link)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO reminders
+                    (chat_id, user_id, user_name, message_id, remind_time, remind_epoch, reason, link)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (chat_id, user_id, user_name, message_id, remind_time.isoformat(), reason, link),
+                (
+                    chat_id, user_id, user_name, message_id,
+                    remind_time.isoformat(), remind_time.timestamp(), reason, link,
+                ),
             )
-            conn.commit()
             return cursor.lastrowid
 
     def delete_reminder(self, reminder_id):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
-            conn.commit()
+        with self._lock:
+            self._conn.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+
+    def delete_reminders(self, reminder_ids):
+        # One statement per chunk, so a sweep commits once instead of once per row
+        reminder_ids = list(reminder_ids)
+        with self._lock:
+            for i in range(0, len(reminder_ids), 500):
+                chunk = reminder_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                self._conn.execute(f"DELETE FROM reminders WHERE id IN ({placeholders})", chunk)
 
     def get_pending_reminders(self):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM reminders")
-            return cursor.fetchall()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, chat_id, user_id, message_id, remind_epoch, reason, link FROM reminders "
+                "WHERE remind_epoch IS NOT NULL"
+            ).fetchall()
 
     def get_user_reminders(self, chat_id, user_id):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM reminders WHERE chat_id = ? AND user_id = ? ORDER BY remind_time ASC",
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, remind_epoch, reason FROM reminders "
+                "WHERE chat_id = ? AND user_id = ? AND remind_epoch IS NOT NULL "
+                "ORDER BY remind_time ASC",
                 (chat_id, user_id),
-            )
-            return cursor.fetchall()
+            ).fetchall()
 
     def get_chat_reminders(self, chat_id):
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM reminders WHERE chat_id = ? ORDER BY remind_time ASC",
+        with self._lock:
+            return self._conn.execute(
+                "SELECT user_name, remind_epoch, reason FROM reminders "
+                "WHERE chat_id = ? AND remind_epoch IS NOT NULL ORDER BY remind_time ASC",
                 (chat_id,),
-            )
-            return cursor.fetchall()
+            ).fetchall()
+
+    # Async wrappers: run the blocking calls in a worker thread so the event loop keeps serving updates
+    async def a_set_state(self, key, value):
+        return await asyncio.to_thread(self.set_state, key, value)
+
+    async def a_get_state(self, key):
+        return await asyncio.to_thread(self.get_state, key)
+
+    async def a_clear_state(self, key):
+        return await asyncio.to_thread(self.clear_state, key)
+
+    async def a_add_reminder(self, chat_id, user_id, user_name, message_id, remind_time, reason, link):
+        return await asyncio.to_thread(
+            self.add_reminder, chat_id, user_id, user_name, message_id, remind_time, reason, link
+        )
+
+    async def a_delete_reminder(self, reminder_id):
+        return await asyncio.to_thread(self.delete_reminder, reminder_id)
+
+    async def a_delete_reminders(self, reminder_ids):
+        return await asyncio.to_thread(self.delete_reminders, reminder_ids)
+
+    async def a_get_pending_reminders(self):
+        return await asyncio.to_thread(self.get_pending_reminders)
+
+    async def a_get_user_reminders(self, chat_id, user_id):
+        return await asyncio.to_thread(self.get_user_reminders, chat_id, user_id)
+
+    async def a_get_chat_reminders(self, chat_id):
+        return await asyncio.to_thread(self.get_chat_reminders, chat_id)
 
 
 db = DatabaseManager()
@@ -142,6 +302,119 @@ db = DatabaseManager()
 # --- Configuration Management ---
 
 
+FileSignature = tuple[int, int, int]
+
+
+def file_signature(path) -> FileSignature | None:
+    """(mtime_ns, size, inode) from a single stat, or None if the file does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def atomic_write(path, text):
+    """Writes text to path via a temp file and os.replace, so readers never see a partial file.
+
+    A file bind-mounted on its own (as in docker-compose.yml) can't be replaced; it is
+    rewritten in place instead.
+    """
+    # A unique name per call, so concurrent writers never share a temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; keep the permissions the config already had
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+        return
+    except OSError as e:
+        if e.errno not in (errno.EBUSY, errno.EXDEV):
+            raise
+    finally:
+        # Already gone when the replace succeeded
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    with open(path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# Option values rarely change between reloads, so the parsed sets are memoized by raw string
+@functools.lru_cache(maxsize=256)
+def parse_list(raw: str) -> frozenset[str]:
+    """Splits a comma-separated option into a set of lowercased names."""
+    return frozenset(x.strip().lower() for x in raw.split(",")) if raw else frozenset()
+
+
+@functools.lru_cache(maxsize=256)
+def parse_int_list(raw: str) -> frozenset[int]:
+    """Splits a comma-separated option into a set of integer IDs, skipping anything else."""
+    return frozenset(int(x.strip()) for x in raw.split(",") if x.strip().isdigit())
+
+
+# Cached so a bad value is warned about once, not on every reload
+@functools.lru_cache(maxsize=16)
+def parse_http_version(raw: str) -> Literal["1.1", "2"]:
+    """Maps the [network] http_version option to a version HTTPXRequest accepts."""
+    raw = raw.strip()
+    if raw in ("2", "2.0"):
+        return "2"
+    if raw != "1.1":
+        logger.warning(f"Unknown http_version {raw!r}, using 1.1")
+    return "1.1"
+
+
+@dataclass(frozen=True, slots=True)
+class ConfigSnapshot:
+    """Everything parsed from the config files in one reload. Replaced whole, never mutated."""
+
+    config: configparser.ConfigParser
+    config_sig: FileSignature | None
+    example_sig: FileSignature | None
+    send_as_reply: bool
+    mention_user: bool
+    enable_delete_button: bool
+    delete_allowed: str
+    cooldown_seconds: float
+    remind_include_link: bool
+    process_whole_message: bool
+    disabled_rules: frozenset[str]
+    rule_keys: tuple[str, ...]
+    access_policy: str
+    # Already widened with "supergroup" when "group" is allowed
+    allow_chat_types: frozenset[str]
+    deny_chat_types: frozenset[str]
+    whitelist_chats: frozenset[int]
+    blacklist_chats: frozenset[int]
+    whitelist_users: frozenset[int]
+    blacklist_users: frozenset[int]
+    access_control_users: frozenset[int]
+    allow_admin_claim_access: bool
+    http_version: Literal["1.1", "2"]
+    connection_pool_size: int
+    # Rules as parallel tuples: patterns[i] is replaced by replacements[i]
+    patterns: tuple[re.Pattern, ...]
+    replacements: tuple[str, ...]
+    rule_literals: tuple[str | None, ...]
+    combined: re.Pattern | None
+    has_literal_free_rule: bool
+    # Some case-insensitive rule has a literal, which non-ASCII text can't be checked against
+    has_ignorecase_literal: bool
+    # Rules that can match inside a URL (one whose required literal has whitespace can't)
+    url_rule_indices: tuple[int, ...]
+
+
 class ConfigManager:
     def __init__(
         self,
@@ -154,12 +427,12 @@ class ConfigManager:
         self.secrets_file = secrets_file
 
         # Disable interpolation to allow % characters
-        self.config = configparser.ConfigParser(interpolation=None)
+        secrets = configparser.ConfigParser(interpolation=None)
 
         # 1. Load Secrets
-        self.config.read([secrets_file])
+        secrets.read([secrets_file])
         self.token = os.environ.get(
-            "BOT_TOKEN", self.config.get("secrets", "token", fallback=None)
+            "BOT_TOKEN", secrets.get("secrets", "token", fallback=None)
         )
 
         if not self.token or self.token == "YOUR_BOT_TOKEN":
@@ -169,122 +442,221 @@ class ConfigManager:
             sys.exit(1)
 
         # 2. Load Dynamic Config
-        self._last_mtime = 0
-        self._last_example_mtime = 0
+        # Reentrant: the save methods hold it across their own reload
+        self._reload_lock = threading.RLock()
+        # (compiled pattern, required literal) keyed by (pattern, flags), reused across reloads
+        self._pattern_cache = {}
         self.load_config()
 
     def load_config(self):
-        try:
-            # Re-initialize config to avoid merging old values with new ones on reload
-            self.config = configparser.ConfigParser(interpolation=None)
-            
-            # Re-load secrets (as they are part of the instance)
-            self.config.read([self.secrets_file])
-
-            # Load example defaults first, then local config overrides
-            files_to_read = []
-            if os.path.exists(self.example_file):
-                files_to_read.append(self.example_file)
-                self._last_example_mtime = os.path.getmtime(self.example_file)
-
-            if os.path.exists(self.config_file):
-                files_to_read.append(self.config_file)
-                self._last_mtime = os.path.getmtime(self.config_file)
-
-            if not files_to_read:
-                logger.warning("No configuration files found. Using hardcoded defaults.")
-                return
-
-            self.config.read(files_to_read)
+        """Reads the config files and makes the result live."""
+        snapshot = self.read_config()
+        if snapshot is not None:
+            self.apply_config(snapshot)
+
+    def read_config(self):
+        """Parses the config files into a ConfigSnapshot without touching live state.
+
+        Safe to call from a worker thread; returns None if parsing fails.
+        """
+        # Serialize reloads so the pattern cache is never updated concurrently
+        with self._reload_lock:
+            try:
+                return self._read_config()
+            except Exception as e:
+                logger.error(f"Error loading configuration: {e}")
+                return None
+
+    def apply_config(self, snapshot):
+        """Makes a parsed snapshot live with a single attribute rebind."""
+        self.settings = snapshot
+        logger.info(f"Configuration loaded. {len(snapshot.patterns)} rules active.")
+
+    def _read_config(self):
+        # Start from a fresh parser to avoid merging old values with new ones on reload
+        config = configparser.ConfigParser(interpolation=None)
+
+        # Re-load secrets (as they are part of the instance)
+        config.read([self.secrets_file])
+
+        # Load example defaults first, then local config overrides
+        files_to_read = []
+        example_sig = file_signature(self.example_file)
+        if example_sig is not None:
+            files_to_read.append(self.example_file)
+
+        config_sig = file_signature(self.config_file)
+        if config_sig is not None:
+            files_to_read.append(self.config_file)
+
+        if not files_to_read:
+            logger.warning("No configuration files found. Using hardcoded defaults.")
+
+        config.read(files_to_read)
+        return self._build_snapshot(config, config_sig, example_sig)
+
+    def _build_snapshot(self, config, config_sig, example_sig, reuse_rules=False):
+        previous = getattr(self, "settings", None)
+        if reuse_rules and previous is not None:
+            # Nothing rule-related changed; keep the parsed rules as they are
+            disabled_rules = previous.disabled_rules
+            rule_keys = previous.rule_keys
+            patterns = previous.patterns
+            replacements = previous.replacements
+            rule_literals = previous.rule_literals
+        else:
+            disabled_rules = self._get_list("bot", "disabled_rules", config)
+            rule_keys = tuple(
+                key for key, val in config.items("substitutions") if val.startswith("s")
+            ) if config.has_section("substitutions") else ()
+            rules = self._parse_rules(config, disabled_rules)
+            patterns = tuple(pattern for pattern, _, _ in rules)
+            replacements = tuple(replacement for _, replacement, _ in rules)
+            rule_literals = tuple(literal for _, _, literal in rules)
+
+        # "group" has always admitted supergroups too; resolve that here, not per message
+        allow_chat_types = self._get_list("access", "allow_chat_types", config)
+        if "group" in allow_chat_types:
+            allow_chat_types |= {"supergroup"}
+
+        # Recompiling the alternation is only needed when the active rules changed
+        if previous is not None and previous.patterns == patterns:
+            combined = previous.combined
+        else:
+            combined = self._combine_rules(patterns)
 
+        return ConfigSnapshot(
+            config=config,
+            config_sig=config_sig,
+            example_sig=example_sig,
             # Bot Settings
-            self.send_as_reply = self.config.getboolean(
-                "bot", "send_as_reply", fallback=True
-            )
-            self.mention_user = self.config.getboolean(
-                "bot", "mention_user", fallback=True
-            )
-            self.enable_delete_button = self.config.getboolean(
+            send_as_reply=config.getboolean("bot", "send_as_reply", fallback=True),
+            mention_user=config.getboolean("bot", "mention_user", fallback=True),
+            enable_delete_button=config.getboolean(
                 "bot", "enable_delete_button", fallback=True
-            )
-            self.delete_allowed = self.config.get(
-                "bot", "delete_allowed", fallback="sender_or_admin"
-            )
-            self.cooldown_seconds = self.config.getfloat(
-                "bot", "cooldown_seconds", fallback=2.0
-            )
-            self.remind_include_link = self.config.getboolean(
+            ),
+            delete_allowed=config.get("bot", "delete_allowed", fallback="sender_or_admin"),
+            cooldown_seconds=config.getfloat("bot", "cooldown_seconds", fallback=2.0),
+            remind_include_link=config.getboolean(
                 "bot", "remind_include_link", fallback=True
-            )
-            self.process_whole_message = self.config.getboolean(
+            ),
+            process_whole_message=config.getboolean(
                 "bot", "process_whole_message", fallback=False
-            )
-            self.disabled_rules = self._get_list("bot", "disabled_rules")
-
+            ),
+            disabled_rules=disabled_rules,
+            rule_keys=rule_keys,
             # Access Control
-            self.access_policy = self.config.get(
-                "access", "access_policy", fallback="off"
-            ).lower()
-            self.allow_chat_types = self._get_list("access", "allow_chat_types")
-            self.deny_chat_types = self._get_list("access", "deny_chat_types")
-            self.whitelist_chats = self._get_int_list("access", "whitelist_chats")
-            self.blacklist_chats = self._get_int_list("access", "blacklist_chats")
-            self.whitelist_users = self._get_int_list("access", "whitelist_users")
-            self.blacklist_users = self._get_int_list("access", "blacklist_users")
-            self.access_control_users = self._get_int_list("access", "access_control_users")
-            self.allow_admin_claim_access = self.config.getboolean("access", "allow_admin_claim_access", fallback=False)
-
+            access_policy=config.get("access", "access_policy", fallback="off").lower(),
+            allow_chat_types=allow_chat_types,
+            deny_chat_types=self._get_list("access", "deny_chat_types", config),
+            whitelist_chats=self._get_int_list("access", "whitelist_chats", config),
+            blacklist_chats=self._get_int_list("access", "blacklist_chats", config),
+            whitelist_users=self._get_int_list("access", "whitelist_users", config),
+            blacklist_users=self._get_int_list("access", "blacklist_users", config),
+            access_control_users=self._get_int_list("access", "access_control_users", config),
+            allow_admin_claim_access=config.getboolean(
+                "access", "allow_admin_claim_access", fallback=False
+            ),
+            # Network (read once at startup)
+            http_version=parse_http_version(config.get("network", "http_version", fallback="1.1")),
+            connection_pool_size=config.getint("network", "connection_pool_size", fallback=64),
             # Rules
-            self.rules = self._parse_rules()
-
-            logger.info(f"Configuration loaded. {len(self.rules)} rules active.")
-
-        except Exception as e:
-            logger.error(f"Error loading configuration: {e}")
+            patterns=patterns,
+            replacements=replacements,
+            rule_literals=rule_literals,
+            combined=combined,
+            has_literal_free_rule=None in rule_literals,
+            has_ignorecase_literal=any(
+                literal is not None and pattern.flags & re.IGNORECASE
+                for pattern, literal in zip(patterns, rule_literals)
+            ),
+            url_rule_indices=tuple(
+                i
+                for i, literal in enumerate(rule_literals)
+                if literal is None or not any(char.isspace() for char in literal)
+            ),
+        )
 
     def add_access_control_user(self, user_id):
         """Adds a user ID to the access_control_users list and saves config."""
-        if user_id not in self.access_control_users:
-            self.access_control_users.append(user_id)
-            # Serialize list to string
-            val_str = ",".join(map(str, self.access_control_users))
-            return self.set_and_save("access", "access_control_users", val_str)
-        return True
+        with self._reload_lock:
+            if user_id not in self.settings.access_control_users:
+                # Serialize set to string
+                val_str = ",".join(map(str, sorted(self.settings.access_control_users | {user_id})))
+                return self.set_and_save("access", "access_control_users", val_str)
+            return True
 
     def set_and_save(self, section, key, value):
         """Updates a setting in memory and saves it to the local config file."""
-        try:
-            # Load only the local config to avoid writing example defaults into it
-            local_cfg = configparser.ConfigParser(interpolation=None)
-            if os.path.exists(self.config_file):
-                local_cfg.read(self.config_file)
-            
-            if not local_cfg.has_section(section):
-                local_cfg.add_section(section)
-            
-            # Convert bool to string for configparser
-            val_str = str(value).lower() if isinstance(value, bool) else str(value)
-            local_cfg.set(section, key, val_str)
-
-            with open(self.config_file, "w") as f:
-                local_cfg.write(f)
-            
-            # Re-sync memory by reloading everything
-            self.load_config()
-            return True
-        except Exception as e:
-            logger.error(f"Failed to save config: {e}")
-            return False
+        return self.save_options([(section, key, value)])
+
+    def save_options(self, options):
+        """Writes (section, key, value) options to the local config file in one go and applies them."""
+        # Saves run in worker threads; hold the lock so two edits can't interleave
+        with self._reload_lock:
+            try:
+                # Load only the local config to avoid writing example defaults into it
+                local_cfg = configparser.ConfigParser(interpolation=None)
+                if os.path.exists(self.config_file):
+                    local_cfg.read(self.config_file)
+                # Taken after the read, so an edit racing it errs towards a full re-read
+                loaded_sig = file_signature(self.config_file)
+
+                for section, key, value in options:
+                    if not local_cfg.has_section(section):
+                        local_cfg.add_section(section)
+                    local_cfg.set(section, key, self._format_value(value))
+
+                buf = io.StringIO()
+                local_cfg.write(buf)
+                atomic_write(self.config_file, buf.getvalue())
+
+                if loaded_sig == self.settings.config_sig:
+                    snapshot = self._with_options(options, file_signature(self.config_file))
+                else:
+                    # The file was edited since the last load and that edit is now in what we
+                    # wrote; the live config doesn't have it, so re-read instead of patching
+                    snapshot = self._read_config()
+                self.apply_config(snapshot)
+                return True
+            except Exception as e:
+                logger.error(f"Failed to save config: {e}")
+                return False
+
+    def stage_options(self, options):
+        """Applies options to the live settings without writing them to disk yet.
+
+        Runs on the event loop without the reload lock, so a save in progress never
+        blocks it. Only for options that leave the rules (and the pattern cache) alone.
+        """
+        self.apply_config(self._with_options(options, self.settings.config_sig))
+
+    def _with_options(self, options, config_sig):
+        # The local file is read last, so applying the options to a copy of the
+        # live config gives the same result as re-reading both files
+        config = configparser.ConfigParser(interpolation=None)
+        config.read_dict(self.settings.config)
+        for section, key, value in options:
+            if not config.has_section(section):
+                config.add_section(section)
+            config.set(section, key, self._format_value(value))
+        # Toggling a bot or access option leaves the rules alone, so skip re-parsing them
+        reuse_rules = not any(
+            section == "substitutions" or (section, key) == ("bot", "disabled_rules")
+            for section, key, _ in options
+        )
+        return self._build_snapshot(config, config_sig, self.settings.example_sig, reuse_rules)
+
+    @staticmethod
+    def _format_value(value):
+        # Convert bool to string for configparser
+        return str(value).lower() if isinstance(value, bool) else str(value)
 
     def toggle_rule(self, rule_key):
         """Toggles a rule between enabled and disabled."""
-        current_disabled = self._get_list("bot", "disabled_rules")
-        if rule_key in current_disabled:
-            current_disabled.remove(rule_key)
-        else:
-            current_disabled.append(rule_key)
-        
-        return self.set_and_save("bot", "disabled_rules", ",".join(current_disabled))
+        with self._reload_lock:
+            current_disabled = self.settings.disabled_rules ^ {rule_key}
+            return self.set_and_save("bot", "disabled_rules", ",".join(sorted(current_disabled)))
 
     def add_rule(self, key, value):
         """Adds or updates a substitution rule."""
@@ -292,84 +664,90 @@ class ConfigManager:
 
     def delete_rule(self, key):
         """Removes a substitution rule."""
-        try:
-            if self.config.has_option("substitutions", key):
-                self.config.remove_option("substitutions", key)
-                
-                # Also clean up from disabled_rules if it was there
-                current_disabled = self._get_list("bot", "disabled_rules")
-                if key in current_disabled:
-                    current_disabled.remove(key)
-                    self.config.set("bot", "disabled_rules", ",".join(current_disabled))
-
-                with open(self.config_file, "w") as f:
-                    self.config.write(f)
-                self.load_config()
-                return True
-            return False
-        except Exception as e:
-            logger.error(f"Failed to delete rule: {e}")
-            return False
+        with self._reload_lock:
+            try:
+                if self.settings.config.has_option("substitutions", key):
+                    # Edit a copy; handlers may be reading the live config meanwhile
+                    config = configparser.ConfigParser(interpolation=None)
+                    config.read_dict(self.settings.config)
+                    config.remove_option("substitutions", key)
+
+                    # Also clean up from disabled_rules if it was there
+                    current_disabled = self._get_list("bot", "disabled_rules", config)
+                    if key in current_disabled:
+                        current_disabled = current_disabled - {key}
+                        config.set("bot", "disabled_rules", ",".join(sorted(current_disabled)))
+
+                    buf = io.StringIO()
+                    config.write(buf)
+                    atomic_write(self.config_file, buf.getvalue())
+                    self.load_config()
+                    return True
+                return False
+            except Exception as e:
+                logger.error(f"Failed to delete rule: {e}")
+                return False
+
+    def restore_config(self, text):
+        """Replaces the local config with an uploaded one and reloads it.
+
+        Raises if text isn't a readable config, leaving the current file in place.
+        """
+        configparser.ConfigParser(interpolation=None).read_string(text)
+        with self._reload_lock:
+            atomic_write(self.config_file, text)
+            self.load_config()
 
     def reset_to_defaults(self):
         """Resets the local config by copying from the example file."""
-        try:
-            import shutil
-            if os.path.exists(self.example_file):
-                shutil.copy(self.example_file, self.config_file)
-                self.load_config()
-                return True
-            return False
-        except Exception as e:
-            logger.error(f"Failed to reset config: {e}")
-            return False
+        with self._reload_lock:
+            try:
+                if os.path.exists(self.example_file):
+                    with open(self.example_file) as f:
+                        atomic_write(self.config_file, f.read())
+                    self.load_config()
+                    return True
+                return False
+            except Exception as e:
+                logger.error(f"Failed to reset config: {e}")
+                return False
 
     def get_all_substitution_keys(self):
         """Returns all keys in the substitutions section that look like rules."""
-        if not self.config.has_section("substitutions"):
-            return []
-        return [
-            key
-            for key, val in self.config.items("substitutions")
-            if val.startswith("s")
-        ]
-
-    def check_hot_reload(self):
+        return self.settings.rule_keys
+
+    def config_changed(self):
+        """Returns True if either config file was modified, created or removed since the last load."""
         try:
-            reload_needed = False
-            
-            if os.path.exists(self.example_file):
-                if os.path.getmtime(self.example_file) != self._last_example_mtime:
-                    reload_needed = True
-            
-            if os.path.exists(self.config_file):
-                if os.path.getmtime(self.config_file) != self._last_mtime:
-                    reload_needed = True
-
-            if reload_needed:
-                logger.info("Config file change detected. Reloading...")
-                self.load_config()
-        except Exception as e:
+            return (
+                file_signature(self.example_file) != self.settings.example_sig
+                or file_signature(self.config_file) != self.settings.config_sig
+            )
+        except OSError as e:
             logger.error(f"Hot reload check failed: {e}")
+        return False
 
-    def _get_list(self, section, key):
-        val = self.config.get(section, key, fallback="")
-        return [x.strip().lower() for x in val.split(",")] if val else []
+    def _get_list(self, section, key, config=None):
+        config = self.settings.config if config is None else config
+        return parse_list(config.get(section, key, fallback=""))
 
-    def _get_int_list(self, section, key):
-        val = self.config.get(section, key, fallback="")
-        return [int(x.strip()) for x in val.split(",") if x.strip().isdigit()]
+    def _get_int_list(self, section, key, config=None):
+        config = self.settings.config if config is None else config
+        return parse_int_list(config.get(section, key, fallback=""))
 
-    def _parse_rules(self) -> List[Tuple[re.Pattern, str]]:
+    def _parse_rules(self, config, disabled_rules) -> list[tuple[re.Pattern, str, str | None]]:
         rules = []
-        if not self.config.has_section("substitutions"):
+        if not config.has_section("substitutions"):
+            self._pattern_cache.clear()
             return rules
 
-        for key, val in self.config.items("substitutions"):
+        used_keys = set()
+
+        for key, val in config.items("substitutions"):
             if not val.startswith("s"):
                 continue
 
-            if key in self.disabled_rules:
+            if key in disabled_rules:
                 continue
 
             try:
@@ -392,24 +770,155 @@ class ConfigManager:
                 if "s" in flags_str.lower():
                     re_flags |= re.DOTALL
 
-                compiled_pattern = re.compile(pattern_str, re_flags)
-                rules.append((compiled_pattern, replacement_str))
+                cache_key = (pattern_str, re_flags)
+                cached = self._pattern_cache.get(cache_key)
+                if cached is None:
+                    compiled_pattern = re.compile(pattern_str, re_flags)
+                    cached = (compiled_pattern, required_literal(compiled_pattern))
+                    self._pattern_cache[cache_key] = cached
+                used_keys.add(cache_key)
+                rules.append((cached[0], replacement_str, cached[1]))
             except Exception as e:
                 logger.error(f"Failed to parse rule '{val}': {e}")
 
+        # Drop patterns of rules that were removed or disabled
+        for cache_key in self._pattern_cache.keys() - used_keys:
+            del self._pattern_cache[cache_key]
+
         return rules
 
+    def _combine_rules(self, patterns):
+        """Joins all rule patterns into one alternation, or returns None if they can't be combined."""
+        if not patterns:
+            return None
+
+        branches = []
+        for pattern in patterns:
+            if _BACKREF_RE.search(pattern.pattern):
+                return None
+            inline = "".join(letter for flag, letter in _INLINE_FLAGS if pattern.flags & flag)
+            branches.append(f"(?{inline}:{pattern.pattern})")
+
+        try:
+            return re.compile("|".join(branches))
+        except re.error as e:
+            logger.warning(f"Could not combine rules into a single pattern: {e}")
+            return None
+
 
 cfg = ConfigManager()
 
-# State Tracking
-user_cooldowns = {}
-processed_messages = set()
+# Outbound sends: retries on network errors, worker count and per-chat pacing
+SEND_MAX_ATTEMPTS = 6
+SEND_MAX_BACKOFF = 30
+SEND_WORKERS = 4
+SEND_QUEUE_SIZE = 1000
+SEND_CHAT_INTERVAL = 0.05
+
+# Chat admin lookups are cached to spare a Bot API round trip per button press
+ADMIN_CACHE_TTL = 60
+ADMIN_CACHE_SIZE = 4096
+
+# Settings toggles apply at once; the disk write waits this long to absorb a burst of clicks
+SAVE_DEBOUNCE = 0.25
+# Failed writes are retried this many times before the live settings revert to the file
+SAVE_MAX_ATTEMPTS = 3
+
+# Upper bounds for the in-memory dedup and cooldown tables
+PROCESSED_MAX_MESSAGES = 10_000
+COOLDOWN_MAX_USERS = 10_000
+
+# --- State Tracking ---
+
+
+class BoundedSeenSet:
+    """A set of recently seen ids that forgets the oldest id once maxlen is reached."""
+
+    def __init__(self, maxlen=4096):
+        self.maxlen = maxlen
+        self._order = deque()
+        self._items = set()
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        if item in self._items:
+            return
+        if len(self._order) >= self.maxlen:
+            self._items.discard(self._order.popleft())
+        self._order.append(item)
+        self._items.add(item)
+
+
+class CooldownCache:
+    """Last-action timestamps per key, bounded in size; entries expire after a TTL."""
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._stamps = OrderedDict()
+
+    def __len__(self):
+        return len(self._stamps)
+
+    def get(self, key, default=0):
+        return self._stamps.get(key, default)
+
+    def mark(self, key, now, ttl):
+        self._stamps[key] = now
+        self._stamps.move_to_end(key)
+        # Oldest entries sit at the front; anything past the TTL can't gate a cooldown anymore
+        while self._stamps:
+            oldest_key, oldest_ts = next(iter(self._stamps.items()))
+            if len(self._stamps) <= self.maxsize and now - oldest_ts <= ttl:
+                break
+            del self._stamps[oldest_key]
+
+
+class SendTask(NamedTuple):
+    """A rewritten message waiting for a sender worker."""
+
+    chat_id: int
+    text: str
+    reply_to_message_id: int | None
+    reply_markup: InlineKeyboardMarkup | None
+    message_id: int
+    user_id: int
+
+
+user_cooldowns = CooldownCache(maxsize=COOLDOWN_MAX_USERS)
+processed_messages = BoundedSeenSet(maxlen=PROCESSED_MAX_MESSAGES)
+send_queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+# Earliest monotonic time each chat may receive the next rewrite
+chat_next_send = {}
+# (chat_id, user_id) -> (is_admin, monotonic expiry)
+admin_cache = {}
+# Pending reminders as (due unix time, sequence, job_data), earliest first
+reminder_heap = []
+reminder_seq = itertools.count()
+reminder_wakeup = asyncio.Event()
+# Strong references to fire-and-forget tasks; the event loop itself only keeps weak ones
+background_tasks = set()
+# (section, key) -> value of toggles applied in memory but not yet written, and the task that writes them
+pending_options = {}
+pending_save = None
 
 # --- Logic Functions ---
 
 
-def check_access(update: Update) -> bool:
+def spawn(coro) -> asyncio.Task:
+    """Starts coro as a background task and keeps it referenced until it finishes."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+
+def check_access(update: Update, settings: ConfigSnapshot | None = None) -> bool:
+    s = cfg.settings if settings is None else settings
     chat = update.effective_chat
     user = update.effective_user
 
@@ -417,46 +926,108 @@ def check_access(update: Update) -> bool:
         return False
 
     # 1. Chat Type Check
-    if cfg.allow_chat_types and chat.type not in cfg.allow_chat_types:
-        if (
-            chat.type == "supergroup"
-            and "group" in cfg.allow_chat_types
-            and "supergroup" not in cfg.allow_chat_types
-        ):
-            pass
-        elif chat.type not in cfg.allow_chat_types:
-            return False
+    if s.allow_chat_types and chat.type not in s.allow_chat_types:
+        return False
 
-    if cfg.deny_chat_types and chat.type in cfg.deny_chat_types:
+    if chat.type in s.deny_chat_types:
         return False
 
     # 2. Access Policy
-    if cfg.access_policy == "whitelist":
-        if chat.id not in cfg.whitelist_chats and user.id not in cfg.whitelist_users:
+    if s.access_policy == "whitelist":
+        if chat.id not in s.whitelist_chats and user.id not in s.whitelist_users:
             return False
-    elif cfg.access_policy == "blacklist":
-        if chat.id in cfg.blacklist_chats or user.id in cfg.blacklist_users:
+    elif s.access_policy == "blacklist":
+        if chat.id in s.blacklist_chats or user.id in s.blacklist_users:
             return False
 
     return True
 
 
+@functools.lru_cache(maxsize=1024)
+def mention_prefix(user_id: int, first_name: str) -> str:
+    """Returns the escaped HTML mention put in front of rewritten messages."""
+    # SANITIZATION
+    return f"<a href='tg://user?id={user_id}'>{html.escape(first_name)}</a>: "
+
+
+@functools.lru_cache(maxsize=4096)
+def delete_markup(user_id: int) -> InlineKeyboardMarkup:
+    """Returns the delete button attached to rewrites of user_id's messages."""
+    callback_data = f"del:{user_id}"
+    return InlineKeyboardMarkup([[InlineKeyboardButton("🗑 Delete", callback_data=callback_data)]])
+
+
+def could_match(text: str, settings: ConfigSnapshot | None = None) -> bool:
+    """Returns False when no rule can match anywhere in text, judged by required literals alone."""
+    s = cfg.settings if settings is None else settings
+    if not s.patterns:
+        return False
+    if s.has_literal_free_rule:
+        return True
+    # Under re.IGNORECASE "TWİTTER" matches "twitter", but its casefold doesn't contain it
+    if s.has_ignorecase_literal and not text.isascii():
+        return True
+    folded = text.casefold()
+    return any(literal in folded for literal in s.rule_literals)
+
+
+def apply_rules(
+    text: str, indices=None, settings: ConfigSnapshot | None = None
+) -> tuple[str, bool]:
+    """Runs the rules (all, or just those at indices) over text in order.
+
+    Returns the new text and whether any rule matched.
+    """
+    s = cfg.settings if settings is None else settings
+    # One scan of the combined pattern rejects text that no rule can touch
+    if s.combined is not None and not s.combined.search(text):
+        return text, False
+
+    if indices is None:
+        indices = range(len(s.patterns))
+
+    matched = False
+    folded = None
+    for i in indices:
+        pattern = s.patterns[i]
+        # Cheap substring check before handing the text to the regex engine
+        literal = s.rule_literals[i]
+        if literal is not None:
+            if folded is None:
+                folded = text.casefold()
+                # sre's case-insensitive folding of non-ASCII text differs from casefold
+                unfoldable = not text.isascii()
+            if literal not in folded and not (unfoldable and pattern.flags & re.IGNORECASE):
+                continue
+
+        # subn finds and replaces in a single pass over the text
+        try:
+            candidate, count = pattern.subn(s.replacements[i], text)
+        except re.error as e:
+            logger.error("Regex error: %s", e)
+            continue
+        if count:
+            text = candidate
+            folded = None
+            matched = True
+    return text, matched
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Main message handler."""
-    cfg.check_hot_reload()
-
     # --- RESTORE CONFIG LOGIC ---
     if update.message and update.message.document and context.user_data.get("awaiting_config"):
         doc = update.message.document
         if doc.file_name == "autoregexbot.cfg" or doc.file_name.endswith(".cfg"):
             user = update.effective_user
-            if update.effective_chat.type != ChatType.PRIVATE or user.id not in cfg.access_control_users:
+            if update.effective_chat.type != ChatType.PRIVATE or user.id not in cfg.settings.access_control_users:
                 return
 
             try:
                 new_file = await context.bot.get_file(doc.file_id)
-                await new_file.download_to_drive(cfg.config_file)
-                cfg.load_config()
+                data = await new_file.download_as_bytearray()
+                # Written under the reload lock, so it can't interleave with a settings save
+                await asyncio.to_thread(cfg.restore_config, data.decode("utf-8"))
                 context.user_data["awaiting_config"] = False
                 await update.message.reply_text("✅ <b>Configuration restored successfully.</b>", parse_mode=ParseMode.HTML)
                 return
@@ -481,7 +1052,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 key = key.strip()
                 val = val.strip()
                 if val.startswith("s"):
-                    if cfg.add_rule(key, val):
+                    if await asyncio.to_thread(cfg.add_rule, key, val):
                         await message.reply_text(f"✅ Rule <code>{key}</code> added/updated.", parse_mode=ParseMode.HTML)
                         context.user_data["awaiting_rule"] = False
                         return
@@ -499,109 +1070,123 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if user.id == context.bot.id:
         return
 
-    # Ignore processed
-    if message.message_id in processed_messages:
+    # Ignore processed (message ids are only unique within a chat)
+    message_key = (chat.id, message.message_id)
+    if message_key in processed_messages:
         return
 
     # Ignore old messages (>60s)
-    if message.date:
-        age = (datetime.now(timezone.utc) - message.date).total_seconds()
-        if age > 60:
-            return
+    now_ts = time.time()
+    if message.date and now_ts - message.date.timestamp() > 60:
+        return
 
-    if not check_access(update):
+    # One snapshot for the whole decision, so a reload mid-handler can't mix old and new settings
+    s = cfg.settings
+
+    # Most messages can't match any rule; skip access control and cooldown work for them
+    text = message.text
+    # URL mode only rewrites http(s) links, so text without one can't produce a reply
+    if not s.process_whole_message and ("http" not in text or not s.url_rule_indices):
+        return
+    if not could_match(text, s):
+        return
+
+    if not check_access(update, s):
         return
 
     # Cooldown
-    now_ts = time.time()
     last_time = user_cooldowns.get(user.id, 0)
-    if now_ts - last_time < cfg.cooldown_seconds:
+    if now_ts - last_time < s.cooldown_seconds:
         return
 
     # REGEX LOGIC
-    text = message.text
     matched = False
     response_text = ""
 
-    if cfg.process_whole_message:
+    if s.process_whole_message:
         # 1. Process whole message
-        new_text = text
-        for pattern, replacement in cfg.rules:
-            if pattern.search(new_text):
-                try:
-                    new_text = pattern.sub(replacement, new_text)
-                    matched = True
-                except re.error as e:
-                    logger.error(f"Regex error: {e}")
-        response_text = new_text
+        response_text, matched = apply_rules(text, settings=s)
     else:
         # 2. Only process URLs and send them
         # Extract things that look like URLs
-        urls = re.findall(r"https?://[^\s]+", text)
+        urls = _URL_RE.findall(text)
         processed_urls = []
 
         for url in urls:
-            new_url = url
-            url_matched = False
-            for pattern, replacement in cfg.rules:
-                if pattern.search(new_url):
-                    try:
-                        new_url = pattern.sub(replacement, new_url)
-                        url_matched = True
-                        matched = True
-                    except re.error as e:
-                        logger.error(f"Regex error on URL {url}: {e}")
-            
+            new_url, url_matched = apply_rules(url, s.url_rule_indices, s)
             if url_matched:
                 processed_urls.append(new_url)
-        
-        if processed_urls:
-            response_text = "\n".join(processed_urls)
+
+        matched = bool(processed_urls)
+        response_text = "\n".join(processed_urls)
 
     if not matched or response_text == text or not response_text:
         return
 
-    processed_messages.add(message.message_id)
-    user_cooldowns[user.id] = now_ts
+    processed_messages.add(message_key)
+    user_cooldowns.mark(user.id, now_ts, ttl=max(60, s.cooldown_seconds * 4))
 
-    # SANITIZATION
-    safe_user_name = html.escape(user.first_name)
+    if s.mention_user:
+        response_text = mention_prefix(user.id, user.first_name) + response_text
 
-    if cfg.mention_user:
-        response_text = (
-            f"<a href='tg://user?id={user.id}'>{safe_user_name}</a>: {response_text}"
-        )
+    reply_markup = delete_markup(user.id) if s.enable_delete_button else None
+
+    # Hand off to the sender workers so this handler returns immediately
+    task = SendTask(
+        chat_id=chat.id,
+        text=response_text,
+        reply_to_message_id=message.message_id if s.send_as_reply else None,
+        reply_markup=reply_markup,
+        message_id=message.message_id,
+        user_id=user.id,
+    )
+    try:
+        send_queue.put_nowait(task)
+    except asyncio.QueueFull:
+        logger.warning("Send queue full, dropping rewrite of message %s", message.message_id)
 
-    reply_markup = None
-    if cfg.enable_delete_button:
-        callback_data = f"del:{user.id}"
-        keyboard = [[InlineKeyboardButton("🗑 Delete", callback_data=callback_data)]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
 
-    # --- RETRY SEND LOGIC ---
-    sent = False
-    attempt = 0
+async def _wait_for_chat_slot(chat_id):
+    """Sleeps until chat_id may receive another message, reserving the next slot."""
+    now = time.monotonic()
+    slot = max(now, chat_next_send.get(chat_id, 0))
+    chat_next_send[chat_id] = slot + SEND_CHAT_INTERVAL
+
+    # Forget chats whose slots are long past to keep the table small
+    if len(chat_next_send) > 1000:
+        for stale_chat in [c for c, t in chat_next_send.items() if t < now]:
+            del chat_next_send[stale_chat]
+
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
 
-    while not sent:
+async def deliver(bot, task: SendTask):
+    """Sends one queued rewrite, retrying network errors with backoff."""
+    # --- RETRY SEND LOGIC ---
+    for attempt in range(1, SEND_MAX_ATTEMPTS + 1):
+        await _wait_for_chat_slot(task.chat_id)
         try:
-            attempt += 1
-            if cfg.send_as_reply:
-                await update.message.reply_text(
-                    response_text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=reply_markup,
-                    disable_web_page_preview=False,
-                )
-            else:
-                await context.bot.send_message(
-                    chat_id=chat.id,
-                    text=response_text,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=reply_markup,
-                    disable_web_page_preview=False,
-                )
-            logger.info(f"Rewrote message {message.message_id} for user {user.id}")
-            sent = True
+            await bot.send_message(
+                chat_id=task.chat_id,
+                text=task.text,
+                reply_to_message_id=task.reply_to_message_id,
+                parse_mode=ParseMode.HTML,
+                reply_markup=task.reply_markup,
+                disable_web_page_preview=False,
+            )
+            logger.info("Rewrote message %s for user %s", task.message_id, task.user_id)
+            return
+
+        except RetryAfter as e:
+            # Flood control: Telegram tells us exactly how long to back off
+            delay = e.retry_after
+            if isinstance(delay, timedelta):
+                delay = delay.total_seconds()
+            logger.warning("Rate limited in chat %s. Retrying in %ss...", task.chat_id, delay)
+            chat_next_send[task.chat_id] = time.monotonic() + delay
+            if attempt == SEND_MAX_ATTEMPTS:
+                break
 
         except (
             NetworkError,
@@ -610,28 +1195,60 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             httpx.ReadTimeout,
             httpx.WriteTimeout,
         ) as e:
+            if attempt == SEND_MAX_ATTEMPTS:
+                break
+            # Exponential backoff with jitter so recovering clients don't retry in lockstep
+            delay = min(SEND_MAX_BACKOFF, 0.5 * 2**attempt) + random.random()
             logger.warning(
-                f"Connection failed (Attempt {attempt}). Retrying in 5s... Error: {e}"
+                "Connection failed (Attempt %s). Retrying in %.1fs... Error: %s", attempt, delay, e
             )
-            await asyncio.sleep(5)
-            # Infinite loop implies we keep going.
-            # If you want to give up eventually, add `if attempt > 10: break` here.
+            await asyncio.sleep(delay)
+
+        except Exception as e:
+            logger.error("Fatal error sending message: %s", e)
+            return  # Non-network error (e.g., Parsing error), stop retrying.
 
+    logger.error("Giving up on message %s after %s attempts.", task.message_id, SEND_MAX_ATTEMPTS)
+
+
+async def sender_worker(bot):
+    """Background task that delivers queued rewrites."""
+    while True:
+        task = await send_queue.get()
+        try:
+            await deliver(bot, task)
         except Exception as e:
-            logger.error(f"Fatal error sending message: {e}")
-            break  # Non-network error (e.g., Parsing error), stop retrying.
+            logger.error("Sender worker failed on message %s: %s", task.message_id, e)
+        finally:
+            send_queue.task_done()
+
+
+async def is_chat_admin(bot, chat_id, user_id) -> bool:
+    """Returns whether user_id administers chat_id, caching the answer for ADMIN_CACHE_TTL seconds."""
+    key = (chat_id, user_id)
+    now = time.monotonic()
+    cached = admin_cache.get(key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    member = await bot.get_chat_member(chat_id, user_id)
+    is_admin = member.status in ["administrator", "creator"]
+
+    admin_cache.pop(key, None)
+    admin_cache[key] = (is_admin, now + ADMIN_CACHE_TTL)
+    if len(admin_cache) > ADMIN_CACHE_SIZE:
+        # Dicts keep insertion order, so the first key is the oldest lookup
+        del admin_cache[next(iter(admin_cache))]
+    return is_admin
 
 
 async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user = query.from_user
 
-    if not query.data.startswith("del:"):
-        await query.answer("Invalid request.")
-        return
-
+    # The handler pattern already guarantees the "del:" prefix
     try:
-        original_sender_id = int(query.data.split(":")[1])
+        original_sender_id = int(query.data[4:])
     except ValueError:
         await query.answer("Error parsing permission data.")
         return
@@ -641,17 +1258,17 @@ async def handle_delete_callback(update: Update, context: ContextTypes.DEFAULT_T
 
     if query.message.chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
         try:
-            member = await context.bot.get_chat_member(query.message.chat_id, user.id)
-            is_admin = member.status in ["administrator", "creator"]
+            is_admin = await is_chat_admin(context.bot, query.message.chat_id, user.id)
         except Exception:
             pass
 
+    delete_allowed = cfg.settings.delete_allowed
     allowed = False
-    if cfg.delete_allowed == "sender" and is_sender:
+    if delete_allowed == "sender" and is_sender:
         allowed = True
-    elif cfg.delete_allowed == "admin" and is_admin:
+    elif delete_allowed == "admin" and is_admin:
         allowed = True
-    elif cfg.delete_allowed == "sender_or_admin" and (is_sender or is_admin):
+    elif delete_allowed == "sender_or_admin" and (is_sender or is_admin):
         allowed = True
 
     if allowed:
@@ -727,28 +1344,87 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def parse_duration(duration_str: str) -> int:
     """Parses a duration string (e.g., 2h, 15m, 1d) and returns total seconds."""
+    # Fast path: a single scan over plain input like "2h" or "1h 30m"
+    total_seconds = 0
+    amount = None
+    gap = False
+    for char in duration_str.lower():
+        if "0" <= char <= "9" and not gap:
+            amount = (amount or 0) * 10 + ord(char) - 48
+        elif char in _DURATION_UNITS and amount is not None:
+            total_seconds += amount * _DURATION_UNITS[char]
+            amount = None
+            gap = False
+        elif char.isspace():
+            gap = amount is not None
+        else:
+            break
+    else:
+        if amount is None:
+            return total_seconds
+
+    # Anything else (stray words, trailing digits) goes through the lenient regex
     total_seconds = 0
-    pattern = re.compile(r"(\d+)\s*([smhd])", re.IGNORECASE)
-    matches = pattern.findall(duration_str)
+    for amount, unit in _DURATION_RE.findall(duration_str):
+        total_seconds += int(amount) * _DURATION_UNITS[unit.lower()]
 
-    if not matches:
-        return 0
+    return total_seconds
 
-    multipliers = {"s": 1, "m": 60, "h": 3600, "d": 86400}
 
-    for amount, unit in matches:
-        total_seconds += int(amount) * multipliers[unit.lower()]
+def schedule_reminder(due: float, job_data: dict):
+    """Queues a reminder for the reminder worker, waking it if this is now the earliest one."""
+    entry = (due, next(reminder_seq), job_data)
+    heapq.heappush(reminder_heap, entry)
+    if reminder_heap[0] is entry:
+        reminder_wakeup.set()
 
-    return total_seconds
 
+def cancel_reminder(reminder_id: int):
+    """Drops a reminder from the queue so the worker never sends it."""
+    remaining = [entry for entry in reminder_heap if entry[2].get("reminder_id") != reminder_id]
+    if len(remaining) != len(reminder_heap):
+        reminder_heap[:] = remaining
+        heapq.heapify(reminder_heap)
 
-async def schedule_reminder(
-    context: ContextTypes.DEFAULT_TYPE, seconds: int, job_data: dict
-):
-    """Background task to wait and send the reminder."""
-    await asyncio.sleep(seconds)
 
-    reminder_id = job_data.get("reminder_id")
+async def reminder_worker(bot):
+    """Background task that sleeps until the earliest reminder is due, then sends everything due."""
+    while True:
+        reminder_wakeup.clear()
+        if not reminder_heap:
+            await reminder_wakeup.wait()
+            continue
+
+        delay = reminder_heap[0][0] - time.time()
+        if delay > 0:
+            # An earlier reminder may be queued meanwhile; the event cuts the sleep short
+            try:
+                await asyncio.wait_for(reminder_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        now = time.time()
+        due = []
+        while reminder_heap and reminder_heap[0][0] <= now:
+            due.append(heapq.heappop(reminder_heap)[2])
+        spawn(send_reminders(bot, due, send_reminder))
+
+
+async def send_reminders(bot, jobs, send):
+    """Sends a batch of reminders concurrently, then deletes the delivered ones in one go."""
+    results = await asyncio.gather(*(send(bot, job_data) for job_data in jobs))
+    sent_ids = [
+        job_data["reminder_id"]
+        for job_data, ok in zip(jobs, results)
+        if ok and job_data.get("reminder_id")
+    ]
+    if sent_ids:
+        await db.a_delete_reminders(sent_ids)
+
+
+async def send_reminder(bot, job_data: dict) -> bool:
+    """Sends a due reminder; returns True once it is delivered."""
     chat_id = job_data["chat_id"]
     user_id = job_data["user_id"]
     message_id = job_data["message_id"]
@@ -764,16 +1440,16 @@ async def schedule_reminder(
         text += f"\n\n🔗 <a href='{link}'>Original Message</a>"
 
     try:
-        await context.bot.send_message(
+        await bot.send_message(
             chat_id=chat_id,
             text=text,
             reply_to_message_id=message_id,
             parse_mode=ParseMode.HTML,
         )
-        if reminder_id:
-            db.delete_reminder(reminder_id)
+        return True
     except Exception as e:
         logger.error(f"Failed to send reminder: {e}")
+        return False
 
 
 async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -793,7 +1469,7 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Extract reason in parentheses
     reason = ""
-    reason_match = re.search(r"\((.*)\)", args_str)
+    reason_match = _REASON_RE.search(args_str)
     if reason_match:
         reason = reason_match.group(1)
         # Remove reason from args to parse duration
@@ -813,14 +1489,14 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Prepare link
     link = None
-    if cfg.remind_include_link and message.reply_to_message:
+    if cfg.settings.remind_include_link and message.reply_to_message:
         reply = message.reply_to_message
         if update.effective_chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
             chat_id_str = str(update.effective_chat.id).replace("-100", "")
             link = f"https://t.me/c/{chat_id_str}/{reply.message_id}"
 
     # Save to Database
-    reminder_id = db.add_reminder(
+    reminder_id = await db.a_add_reminder(
         chat_id=update.effective_chat.id,
         user_id=user.id,
         user_name=user.first_name,
@@ -840,15 +1516,15 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "link": link,
     }
 
-    # Launch background task
-    asyncio.create_task(schedule_reminder(context, seconds, job_data))
+    # Hand it to the reminder worker
+    schedule_reminder(remind_time.timestamp(), job_data)
 
     # Confirmation
     iso_time_utc = remind_time.strftime("%Y-%m-%dT%H:%M:%SZ")
     
     # Calculate IST time (defaulting to IST as user timezone isn't provided by Telegram API)
-    ist_time = remind_time.astimezone(ZoneInfo("Asia/Kolkata"))
-    ist_str = ist_time.strftime("%Y-%m-%d %H:%M:%S")
+    ist_time = remind_time.astimezone(_IST)
+    ist_str = ist_time.strftime(_TIME_FMT)
 
     hours, remainder = divmod(seconds, 3600)
     minutes, seconds_left = divmod(remainder, 60)
@@ -863,6 +1539,11 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await message.reply_text(confirm_text, parse_mode=ParseMode.HTML)
 
 
+REMINDERS_MANAGE_MARKUP = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("🗑 Manage / Delete", callback_data="rem:manage")]]
+)
+
+
 async def reminders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Shows pending reminders for the user in the current chat."""
     if not check_access(update):
@@ -871,21 +1552,20 @@ async def reminders_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     
-    rows = db.get_user_reminders(chat_id, user_id)
+    rows = await db.a_get_user_reminders(chat_id, user_id)
     if not rows:
         await update.message.reply_text("You have no pending reminders in this chat.")
         return
 
-    text = "<b>Your Pending Reminders:</b>\n\n"
+    lines = ["<b>Your Pending Reminders:</b>", ""]
     for row in rows:
-        remind_time = datetime.fromisoformat(row["remind_time"]).astimezone(ZoneInfo("Asia/Kolkata"))
-        time_str = remind_time.strftime("%Y-%m-%d %H:%M:%S")
+        remind_time = datetime.fromtimestamp(row["remind_epoch"], _IST)
+        time_str = remind_time.strftime(_TIME_FMT)
         reason = f" ({row['reason']})" if row["reason"] else ""
-        text += f"• <code>{time_str}</code>{reason}\n"
+        lines.append(f"• <code>{time_str}</code>{reason}")
+    text = "\n".join(lines)
 
-    keyboard = [[InlineKeyboardButton("🗑 Manage / Delete", callback_data="rem:manage")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    await update.message.reply_text(text, reply_markup=REMINDERS_MANAGE_MARKUP, parse_mode=ParseMode.HTML)
 
 
 async def reminders_manage_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -894,7 +1574,7 @@ async def reminders_manage_menu(update: Update, context: ContextTypes.DEFAULT_TY
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
     
-    rows = db.get_user_reminders(chat_id, user_id)
+    rows = await db.a_get_user_reminders(chat_id, user_id)
     if not rows:
         text = "You have no pending reminders."
         if query:
@@ -905,8 +1585,8 @@ async def reminders_manage_menu(update: Update, context: ContextTypes.DEFAULT_TY
 
     keyboard = []
     for row in rows:
-        remind_time = datetime.fromisoformat(row["remind_time"]).astimezone(ZoneInfo("Asia/Kolkata"))
-        time_str = remind_time.strftime("%d/%m %H:%M")
+        remind_time = datetime.fromtimestamp(row["remind_epoch"], _IST)
+        time_str = remind_time.strftime(_SHORT_TIME_FMT)
         reason = row["reason"][:15] + ".." if row["reason"] and len(row["reason"]) > 15 else (row["reason"] or "No reason")
         
         keyboard.append([
@@ -926,30 +1606,39 @@ async def reminders_manage_menu(update: Update, context: ContextTypes.DEFAULT_TY
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 
+async def reminders_close(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer("Menu closed.")
+    await query.message.delete()
+
+
+async def reminders_manage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Loading reminders...")
+    await reminders_manage_menu(update, context)
+
+
+REMINDER_ROUTES = {
+    "rem:close": reminders_close,
+    "rem:manage": reminders_manage,
+}
+
+
 async def handle_reminder_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles reminder management callbacks."""
     query = update.callback_query
-    
+
     data = query.data
-    if data == "rem:close":
-        await query.answer("Menu closed.")
-        await query.message.delete()
-        return
-    
-    if data == "rem:manage":
-        await query.answer("Loading reminders...")
-        await reminders_manage_menu(update, context)
-        return
-        
-    if data.startswith("set:"): # Guard for safety if needed, but pattern handles it
-        await query.answer()
+    handler = REMINDER_ROUTES.get(data)
+    if handler is not None:
+        await handler(update, context)
         return
 
     # rem:del:id
-    parts = data.split(":")
-    if len(parts) == 3 and parts[1] == "del":
-        reminder_id = int(parts[2])
-        db.delete_reminder(reminder_id)
+    match = _REMINDER_DELETE_RE.fullmatch(data)
+    if match is not None:
+        reminder_id = int(match.group(1))
+        await db.a_delete_reminder(reminder_id)
+        cancel_reminder(reminder_id)
         await query.answer("🗑 Reminder deleted!")
         # Refresh the menu
         await reminders_manage_menu(update, context)
@@ -964,72 +1653,55 @@ async def reminders_all_command(update: Update, context: ContextTypes.DEFAULT_TY
 
     chat_id = update.effective_chat.id
     
-    rows = db.get_chat_reminders(chat_id)
+    rows = await db.a_get_chat_reminders(chat_id)
     if not rows:
         await update.message.reply_text("There are no pending reminders in this chat.")
         return
 
-    text = "<b>All Pending Reminders:</b>\n\n"
+    lines = ["<b>All Pending Reminders:</b>", ""]
     for row in rows:
-        remind_time = datetime.fromisoformat(row["remind_time"]).astimezone(ZoneInfo("Asia/Kolkata"))
-        time_str = remind_time.strftime("%Y-%m-%d %H:%M:%S")
+        remind_time = datetime.fromtimestamp(row["remind_epoch"], _IST)
+        time_str = remind_time.strftime(_TIME_FMT)
         reason = f" ({row['reason']})" if row["reason"] else ""
-        text += f"• {row['user_name']}: <code>{time_str}</code>{reason}\n"
+        lines.append(f"• {row['user_name']}: <code>{time_str}</code>{reason}")
+    text = "\n".join(lines)
 
     await update.message.reply_text(text, parse_mode=ParseMode.HTML)
 
 
-async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Shows the settings menu."""
-    if not check_access(update):
-        return
-
-    user = update.effective_user
-    query = update.callback_query
-
-    # 1. Determine Admin Status (for groups)
-    is_admin = False
-    if update.effective_chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
-        try:
-            member = await context.bot.get_chat_member(update.effective_chat.id, user.id)
-            is_admin = member.status in ["administrator", "creator"]
-        except Exception:
-            pass
-
-    # 2. Check Permission to view settings
-    is_whitelisted = user.id in cfg.whitelist_users
-    is_access_user = user.id in cfg.access_control_users
-    
-    if not is_whitelisted and not is_access_user and not is_admin:
-        msg = "⛔ Access denied. Only whitelisted users or admins can change settings."
-        if query:
-            await query.answer(msg, show_alert=True)
-        else:
-            await update.message.reply_text(msg)
-        return
-
+@functools.lru_cache(maxsize=64)
+def settings_markup(
+    send_as_reply: bool,
+    mention_user: bool,
+    process_whole_message: bool,
+    enable_delete_button: bool,
+    allow_admin_claim_access: bool,
+    show_claim: bool,
+    show_advanced: bool,
+) -> InlineKeyboardMarkup:
+    """Builds the main settings keyboard; the layout depends only on these flags."""
     keyboard = [
         [
             InlineKeyboardButton(
-                f"{'✅' if cfg.send_as_reply else '❌'} Reply to original",
+                f"{'✅' if send_as_reply else '❌'} Reply to original",
                 callback_data="set:bot:send_as_reply",
             )
         ],
         [
             InlineKeyboardButton(
-                f"{'✅' if cfg.mention_user else '❌'} Mention User",
+                f"{'✅' if mention_user else '❌'} Mention User",
                 callback_data="set:bot:mention_user",
             )
         ],
         [
             InlineKeyboardButton(
-                f"{'✅' if cfg.process_whole_message else '❌'} Process Whole Msg",
+                f"{'✅' if process_whole_message else '❌'} Process Whole Msg",
                 callback_data="set:bot:process_whole_message",
             )
         ],
         [
             InlineKeyboardButton(
-                f"{'✅' if cfg.enable_delete_button else '❌'} Delete Button",
+                f"{'✅' if enable_delete_button else '❌'} Delete Button",
                 callback_data="set:bot:enable_delete_button",
             )
         ],
@@ -1042,14 +1714,14 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     ]
 
     # Admin Claim Access Button
-    if cfg.allow_admin_claim_access and is_admin and not is_access_user:
+    if show_claim:
         keyboard.insert(0, [InlineKeyboardButton("👑 Claim Bot Access", callback_data="set:action:claim_access")])
 
     # Advanced Settings (Backup/Restore/Claim Toggle) - Only for access_control_users in DMs
-    if update.effective_chat.type == ChatType.PRIVATE and is_access_user:
+    if show_advanced:
         keyboard.append([
              InlineKeyboardButton(
-                f"{'✅' if cfg.allow_admin_claim_access else '❌'} Allow Admin Claim",
+                f"{'✅' if allow_admin_claim_access else '❌'} Allow Admin Claim",
                 callback_data="set:access:allow_admin_claim_access",
             )
         ])
@@ -1079,26 +1751,76 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ],
         [InlineKeyboardButton("Close", callback_data="set:close")],
     ])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    text = "<b>Bot Settings</b>"
-    
-    if query:
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
-    else:
-        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    return InlineKeyboardMarkup(keyboard)
 
 
-async def restart_confirmation_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Shows a confirmation menu before restarting the container."""
-    query = update.callback_query
-    keyboard = [
-        [InlineKeyboardButton("🔄 YES, RESTART NOW", callback_data="set:action:restart_do")],
-        [InlineKeyboardButton("⬅️ Cancel", callback_data="set:menu:main")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the settings menu."""
+    # Access, admin need and the menu state all come from the same config
+    s = cfg.settings
+    if not check_access(update, s):
+        return
+
+    user = update.effective_user
+    query = update.callback_query
+
+    is_whitelisted = user.id in s.whitelist_users
+    is_access_user = user.id in s.access_control_users
+
+    # 1. Determine Admin Status (for groups)
+    # Only asked when it decides access or the claim button; access users never need it
+    is_admin = False
+    needs_admin = not is_access_user and (not is_whitelisted or s.allow_admin_claim_access)
+    if needs_admin and update.effective_chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
+        try:
+            is_admin = await is_chat_admin(context.bot, update.effective_chat.id, user.id)
+        except Exception:
+            pass
+
+    # 2. Check Permission to view settings
+    if not is_whitelisted and not is_access_user and not is_admin:
+        msg = "⛔ Access denied. Only whitelisted users or admins can change settings."
+        if query:
+            await query.answer(msg, show_alert=True)
+        else:
+            await update.message.reply_text(msg)
+        return
+
+    reply_markup = settings_markup(
+        s.send_as_reply,
+        s.mention_user,
+        s.process_whole_message,
+        s.enable_delete_button,
+        s.allow_admin_claim_access,
+        show_claim=s.allow_admin_claim_access and is_admin and not is_access_user,
+        show_advanced=update.effective_chat.type == ChatType.PRIVATE and is_access_user,
+    )
+    text = "<b>Bot Settings</b>"
+    
+    if query:
+        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+
+
+# The confirmation keyboards never change, so they are built once
+RESTART_CONFIRM_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 YES, RESTART NOW", callback_data="set:action:restart_do")],
+    [InlineKeyboardButton("⬅️ Cancel", callback_data="set:menu:main")],
+])
+RESET_CONFIRM_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔥 YES, RESET EVERYTHING", callback_data="set:action:reset_do")],
+    [InlineKeyboardButton("⬅️ Cancel", callback_data="set:menu:main")],
+])
+
+
+async def restart_confirmation_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows a confirmation menu before restarting the container."""
+    query = update.callback_query
+    reply_markup = RESTART_CONFIRM_MARKUP
     text = (
         "<b>🔄 RESTART BOT</b>\n\n"
-        "This will terminate the current process. Docker will automatically restart the container.\n\n"
+        "This will shut the bot down and start it again in the same process.\n\n"
         "The bot will be offline for a few seconds. Proceed?"
     )
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
@@ -1107,11 +1829,7 @@ async def restart_confirmation_menu(update: Update, context: ContextTypes.DEFAUL
 async def reset_confirmation_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Shows a scary confirmation menu before resetting."""
     query = update.callback_query
-    keyboard = [
-        [InlineKeyboardButton("🔥 YES, RESET EVERYTHING", callback_data="set:action:reset_do")],
-        [InlineKeyboardButton("⬅️ Cancel", callback_data="set:menu:main")],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = RESET_CONFIRM_MARKUP
     text = (
         "<b>⚠️ WARNING: RESET TO DEFAULTS</b>\n\n"
         "This will delete ALL your custom rules and settings in <code>autoregexbot.cfg</code> "
@@ -1121,28 +1839,25 @@ async def reset_confirmation_menu(update: Update, context: ContextTypes.DEFAULT_
     await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 
-async def substitutions_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Shows the menu to toggle individual regex rules."""
-    query = update.callback_query
-    
-    # Check if we are in delete mode
-    is_delete_mode = context.user_data.get("delete_mode", False)
-    
-    keys = cfg.get_all_substitution_keys()
+@functools.lru_cache(maxsize=8)
+def substitutions_markup(
+    keys: tuple[str, ...], disabled_rules: frozenset[str], is_delete_mode: bool
+) -> InlineKeyboardMarkup:
+    """Builds the rule list keyboard; cached so refreshing an unchanged menu costs one lookup."""
     keyboard = []
-    
+
     for key in keys:
         if is_delete_mode:
             btn_text = f"🗑 {key}"
             callback = f"set:delrule:{key}"
         else:
-            is_enabled = key not in cfg.disabled_rules
+            is_enabled = key not in disabled_rules
             status_icon = "✅" if is_enabled else "❌"
             btn_text = f"{status_icon} {key}"
             callback = f"set:rule:{key}"
-            
+
         keyboard.append([InlineKeyboardButton(btn_text, callback_data=callback)])
-    
+
     # Add Control Buttons
     control_row = []
     if is_delete_mode:
@@ -1150,11 +1865,21 @@ async def substitutions_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         control_row.append(InlineKeyboardButton("➕ Add Rule", callback_data="set:rule:add_prompt"))
         control_row.append(InlineKeyboardButton("🗑 Delete Mode", callback_data="set:menu:subs_delete"))
-    
+
     keyboard.append(control_row)
     keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data="set:menu:main")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def substitutions_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the menu to toggle individual regex rules."""
+    query = update.callback_query
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Check if we are in delete mode
+    is_delete_mode = context.user_data.get("delete_mode", False)
+    
+    s = cfg.settings
+    reply_markup = substitutions_markup(s.rule_keys, s.disabled_rules, is_delete_mode)
     if is_delete_mode:
         text = "<b>Delete Rules</b>\nTap a rule to permanently remove it."
     else:
@@ -1166,366 +1891,317 @@ async def substitutions_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 
-async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-
-
-    """Handles settings button clicks."""
-
-
+async def settings_close(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
+    await query.answer("Menu closed.")
+    await query.message.delete()
 
 
-    data = query.data
-
-
-
-
-
-    if data == "set:close":
-
-
-        await query.answer("Menu closed.")
-
-
+async def settings_init_config(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Creates the local config from the example file (button shown by /start when it's missing)."""
+    query = update.callback_query
+    if os.path.exists(cfg.config_file):
+        await query.answer("✅ Config already exists.")
         await query.message.delete()
-
-
         return
 
+    if await asyncio.to_thread(cfg.reset_to_defaults):
+        await query.answer("✅ Initialized successfully!", show_alert=True)
+        await query.edit_message_text(
+            "✅ <b>Initialization Complete!</b>\n"
+            "The configuration file <code>autoregexbot.cfg</code> has been created.\n"
+            "You can now use /settings to configure the bot.",
+            parse_mode=ParseMode.HTML
+        )
+    else:
+        await query.answer("❌ Failed to initialize.", show_alert=True)
 
 
+async def settings_subs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Loading rules...")
+    await substitutions_menu(update, context)
 
 
-        if not data.startswith("set:"):
-
-
-
-
-
-            await query.answer()
-
-
-
-
-
-            return
-
-
-
-
-
-    
-
-
-
-
-
-        # Initialization Bypass
-
-
-
-
-
-        if data == "set:init:config":
-
-
-
-
-
-            if os.path.exists(cfg.config_file):
-
-
-
-
-
-                await query.answer("✅ Config already exists.")
-
-
-
-
-
-                await query.message.delete()
-
-
-
-
-
-                return
-
-
-
-
-
-            
-
-
-
-
-
-            if cfg.reset_to_defaults():
-
-
-
-
-
-                 await query.answer("✅ Initialized successfully!", show_alert=True)
-
-
-
-
-
-                 await query.edit_message_text(
-
-
-
-
-
-                     "✅ <b>Initialization Complete!</b>\n"
-
-
-
-
-
-                     "The configuration file <code>autoregexbot.cfg</code> has been created.\n"
-
-
-
-
-
-                     "You can now use /settings to configure the bot.",
-
-
-
-
-
-                     parse_mode=ParseMode.HTML
-
-
+async def settings_reset_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Warning: Reset requested.")
+    await reset_confirmation_menu(update, context)
 
 
+async def settings_reset_do(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if await asyncio.to_thread(cfg.reset_to_defaults):
+        await query.answer("✅ Settings reset to defaults!", show_alert=True)
+        await query.edit_message_text("✅ <b>Configuration has been reset to defaults.</b>", parse_mode=ParseMode.HTML)
+        # Send fresh settings after a short delay
+        await asyncio.sleep(2)
+        await settings_command(update, context)
+        await query.message.delete()
+    else:
+        await query.answer("❌ Failed to reset configuration.", show_alert=True)
 
-                 )
 
+async def settings_restart_confirm(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Restart requested.")
+    await restart_confirmation_menu(update, context)
 
 
+async def settings_restart_do(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer("🔄 Restarting bot...", show_alert=True)
+    await query.edit_message_text("🔄 <b>Restarting...</b> The bot will be back online in a few seconds.", parse_mode=ParseMode.HTML)
+    logger.info(f"Restart initiated by user {update.effective_user.id}")
 
+    # Save state for announcement after restart
+    await db.a_set_state("restart_chat_id", update.effective_chat.id)
 
-                 # Reload to ensure memory is fresh
+    # Shut down cleanly (post_shutdown flushes pending toggles); main() then re-executes the process
+    context.application.bot_data["restart_requested"] = True
+    context.application.stop_running()
 
 
+async def settings_subs_delete(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Delete mode enabled.")
+    context.user_data["delete_mode"] = True
+    await substitutions_menu(update, context)
 
 
+async def settings_subs_normal(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Delete mode disabled.")
+    context.user_data["delete_mode"] = False
+    await substitutions_menu(update, context)
 
-                 cfg.load_config()
 
+async def settings_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Back to main settings.")
+    context.user_data["delete_mode"] = False
+    await settings_command(update, context)
 
 
+async def settings_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_chat.type != ChatType.PRIVATE or query.from_user.id not in cfg.settings.access_control_users:
+        await query.answer("⛔ Access denied.", show_alert=True)
+        return
 
+    await query.answer("Generating backup...")
+    if os.path.exists(cfg.config_file):
+        with open(cfg.config_file, "rb") as f:
+            await context.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=f,
+                filename="autoregexbot.cfg",
+                caption="📄 <b>Configuration Backup</b>",
+                parse_mode=ParseMode.HTML
+            )
+    else:
+        await query.message.reply_text("❌ Config file not found.")
 
-            else:
 
+async def settings_claim_access(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if not cfg.settings.allow_admin_claim_access:
+        await query.answer("❌ This feature is disabled.", show_alert=True)
+        return
 
+    if await asyncio.to_thread(cfg.add_access_control_user, query.from_user.id):
+        await query.answer("👑 Access Granted! You are now in the Access Control list.", show_alert=True)
+        # Refresh menu to show new options
+        await settings_command(update, context)
+    else:
+        await query.answer("❌ Failed to save config.", show_alert=True)
 
 
+async def settings_restore_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_chat.type != ChatType.PRIVATE or query.from_user.id not in cfg.settings.access_control_users:
+        await query.answer("⛔ Access denied.", show_alert=True)
+        return
 
-                await query.answer("❌ Failed to initialize.", show_alert=True)
+    await query.answer()
+    context.user_data["awaiting_config"] = True
+    await query.message.reply_text(
+        "📥 <b>Restore Configuration</b>\n\n"
+        "Please send the <code>autoregexbot.cfg</code> file now.\n"
+        "<i>Note: This will overwrite your current settings.</i>",
+        parse_mode=ParseMode.HTML
+    )
 
 
+async def settings_add_rule_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer("Please send the new rule.")
+    context.user_data["awaiting_rule"] = True
+    await query.message.reply_text(
+        "➕ <b>Adding a new Rule</b>\n"
+        "Please send the rule in the following format:\n"
+        "<code>name = s@pattern@replacement@flags</code>\n\n"
+        "Example:\n<code>twitter = s@twitter.com@fxtwitter.com@i</code>",
+        parse_mode=ParseMode.HTML
+    )
 
 
+# Toggleable options and their config section; set:<section>:<key> must match one of these
+BOOL_SETTINGS = {
+    "send_as_reply": "bot",
+    "mention_user": "bot",
+    "process_whole_message": "bot",
+    "enable_delete_button": "bot",
+    "allow_admin_claim_access": "access",
+}
+
+# Fixed callbacks answered before the permission check
+PUBLIC_SETTINGS_ROUTES = {
+    "set:close": settings_close,
+}
+
+# Fixed callbacks for authorized users; anything else is set:<section|rule|delrule>:<key>
+SETTINGS_ROUTES = {
+    "set:init:config": settings_init_config,
+    "set:menu:subs": settings_subs,
+    "set:menu:reset_confirm": settings_reset_confirm,
+    "set:action:reset_do": settings_reset_do,
+    "set:menu:restart_confirm": settings_restart_confirm,
+    "set:action:restart_do": settings_restart_do,
+    "set:menu:subs_delete": settings_subs_delete,
+    "set:menu:subs_normal": settings_subs_normal,
+    "set:menu:main": settings_main,
+    "set:action:backup": settings_backup,
+    "set:action:claim_access": settings_claim_access,
+    "set:action:restore_prompt": settings_restore_prompt,
+    "set:rule:add_prompt": settings_add_rule_prompt,
+}
 
-            return
 
+async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles settings button clicks."""
+    query = update.callback_query
+    data = query.data
 
+    handler = PUBLIC_SETTINGS_ROUTES.get(data)
+    if handler is not None:
+        await handler(update, context)
+        return
 
     user = query.from_user
-    
+
     # Permission Check
-    is_authorized = user.id in cfg.whitelist_users or user.id in cfg.access_control_users
+    s = cfg.settings
+    is_authorized = user.id in s.whitelist_users or user.id in s.access_control_users
     if not is_authorized and query.message.chat.type in [ChatType.GROUP, ChatType.SUPERGROUP]:
         try:
-
-
-
-
-
-        
-
-
-
-
-
-            member = await context.bot.get_chat_member(query.message.chat_id, user.id)
-            is_authorized = member.status in ["administrator", "creator"]
+            is_authorized = await is_chat_admin(context.bot, query.message.chat_id, user.id)
         except Exception:
             pass
-    
-    if not is_authorized:
-
-
-
-
-
-        
-
-
-
-
-
-        
-
 
+    if not is_authorized:
         await query.answer("⛔ Access denied.", show_alert=True)
-
-
         return
 
-
-
-
-    # Sub-menu navigation
-    if data == "set:menu:subs":
-        await query.answer("Loading rules...")
-        await substitutions_menu(update, context)
-        return
-    if data == "set:menu:reset_confirm":
-        await query.answer("Warning: Reset requested.")
-        await reset_confirmation_menu(update, context)
-        return
-    if data == "set:action:reset_do":
-        if cfg.reset_to_defaults():
-            await query.answer("✅ Settings reset to defaults!", show_alert=True)
-            await query.edit_message_text("✅ <b>Configuration has been reset to defaults.</b>", parse_mode=ParseMode.HTML)
-            # Send fresh settings after a short delay
-            await asyncio.sleep(2)
-            await settings_command(update, context)
-            await query.message.delete()
-        else:
-            await query.answer("❌ Failed to reset configuration.", show_alert=True)
-        return
-    if data == "set:menu:restart_confirm":
-        await query.answer("Restart requested.")
-        await restart_confirmation_menu(update, context)
-        return
-    if data == "set:action:restart_do":
-        await query.answer("🔄 Restarting bot...", show_alert=True)
-        await query.edit_message_text("🔄 <b>Restarting...</b> The bot will be back online in a few seconds.", parse_mode=ParseMode.HTML)
-        logger.info(f"Restart initiated by user {update.effective_user.id}")
-        
-        # Save state for announcement after restart
-        db.set_state("restart_chat_id", update.effective_chat.id)
-        
-        # Small delay to allow the message to be sent before shutdown
-        await asyncio.sleep(1)
-        sys.exit(0)
-    if data == "set:menu:subs_delete":
-        await query.answer("Delete mode enabled.")
-        context.user_data["delete_mode"] = True
-        await substitutions_menu(update, context)
-        return
-    if data == "set:menu:subs_normal":
-        await query.answer("Delete mode disabled.")
-        context.user_data["delete_mode"] = False
-        await substitutions_menu(update, context)
-        return
-    if data == "set:menu:main":
-        await query.answer("Back to main settings.")
-        context.user_data["delete_mode"] = False
-        await settings_command(update, context)
-        return
-    
-    if data == "set:action:backup":
-        if update.effective_chat.type != ChatType.PRIVATE or query.from_user.id not in cfg.access_control_users:
-            await query.answer("⛔ Access denied.", show_alert=True)
-            return
-        
-        await query.answer("Generating backup...")
-        if os.path.exists(cfg.config_file):
-            with open(cfg.config_file, "rb") as f:
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=f,
-                    filename="autoregexbot.cfg",
-                    caption="📄 <b>Configuration Backup</b>",
-                    parse_mode=ParseMode.HTML
-                )
-        else:
-            await query.message.reply_text("❌ Config file not found.")
-        return
-
-    if data == "set:action:claim_access":
-        if not cfg.allow_admin_claim_access:
-            await query.answer("❌ This feature is disabled.", show_alert=True)
-            return
-        
-        if cfg.add_access_control_user(query.from_user.id):
-             await query.answer("👑 Access Granted! You are now in the Access Control list.", show_alert=True)
-             # Refresh menu to show new options
-             await settings_command(update, context)
-        else:
-             await query.answer("❌ Failed to save config.", show_alert=True)
+    handler = SETTINGS_ROUTES.get(data)
+    if handler is not None:
+        await handler(update, context)
         return
 
-    if data == "set:action:restore_prompt":
-        if update.effective_chat.type != ChatType.PRIVATE or query.from_user.id not in cfg.access_control_users:
-            await query.answer("⛔ Access denied.", show_alert=True)
-            return
-            
+    # Format: set:section:key OR set:rule:key OR set:delrule:key
+    match = _SETTING_CALLBACK_RE.fullmatch(data)
+    if match is None:
         await query.answer()
-        context.user_data["awaiting_config"] = True
-        await query.message.reply_text(
-            "📥 <b>Restore Configuration</b>\n\n"
-            "Please send the <code>autoregexbot.cfg</code> file now.\n"
-            "<i>Note: This will overwrite your current settings.</i>",
-            parse_mode=ParseMode.HTML
-        )
         return
-
-    # Format: set:section:key OR set:rule:key OR set:delrule:key
-    parts = data.split(":")
-    type_ = parts[1]
-    key = parts[2]
+    type_, key = match.groups()
 
     if type_ == "rule":
-        if key == "add_prompt":
-            await query.answer("Please send the new rule.")
-            context.user_data["awaiting_rule"] = True
-            await query.message.reply_text(
-                "➕ <b>Adding a new Rule</b>\n"
-                "Please send the rule in the following format:\n"
-                "<code>name = s@pattern@replacement@flags</code>\n\n"
-                "Example:\n<code>twitter = s@twitter.com@fxtwitter.com@i</code>",
-                parse_mode=ParseMode.HTML
-            )
-            return
-        
-        if cfg.toggle_rule(key):
-            is_enabled = key not in cfg.disabled_rules
+        if await asyncio.to_thread(cfg.toggle_rule, key):
+            is_enabled = key not in cfg.settings.disabled_rules
             await query.answer(f"Rule '{key}' {'enabled' if is_enabled else 'disabled'}")
             await substitutions_menu(update, context)
         return
 
     if type_ == "delrule":
-        if cfg.delete_rule(key):
+        if await asyncio.to_thread(cfg.delete_rule, key):
             await query.answer(f"✅ Rule '{key}' deleted!")
             await substitutions_menu(update, context)
         return
 
     # Original boolean toggle logic
-    section = type_
-    current_val = getattr(cfg, key, None)
-    if isinstance(current_val, bool):
-        new_val = not current_val
-        if cfg.set_and_save(section, key, new_val):
-            await query.answer(f"{key.replace('_', ' ').capitalize()} set to {'ON' if new_val else 'OFF'}")
-            # Refresh UI in place
-            await settings_command(update, context)
-    else:
+    if BOOL_SETTINGS.get(key) != type_:
         await query.answer()
+        return
+    # Access options are only offered to access-control users in private chat (see settings_markup);
+    # a group admin forging the callback must not be able to flip them
+    if type_ == "access" and (
+        update.effective_chat.type != ChatType.PRIVATE or user.id not in s.access_control_users
+    ):
+        await query.answer("⛔ Access denied.", show_alert=True)
+        return
+    new_val = not getattr(cfg.settings, key)
+    queue_option_save(type_, key, new_val)
+    await query.answer(f"{key.replace('_', ' ').capitalize()} set to {'ON' if new_val else 'OFF'}")
+    # Refresh UI in place
+    await settings_command(update, context)
+
+
+def queue_option_save(section, key, value):
+    """Applies a setting immediately and schedules one coalesced write for the current burst."""
+    global pending_save
+    cfg.stage_options([(section, key, value)])
+    pending_options[(section, key)] = value
+    if pending_save is None or pending_save.done():
+        pending_save = spawn(flush_options(SAVE_DEBOUNCE))
+
+
+async def flush_options(delay: float):
+    """Waits delay seconds, then writes every pending setting to the config file."""
+    await asyncio.sleep(delay)
+    # Toggles that land while a write is in flight are picked up by the next pass
+    failures = 0
+    while pending_options:
+        options = [(section, key, value) for (section, key), value in pending_options.items()]
+        pending_options.clear()
+        if await asyncio.to_thread(cfg.save_options, options):
+            failures = 0
+        else:
+            failures += 1
+            # Requeue what failed, unless a newer toggle of the same option came in meanwhile
+            for section, key, value in options:
+                pending_options.setdefault((section, key), value)
+            if failures < SAVE_MAX_ATTEMPTS:
+                await asyncio.sleep(SAVE_DEBOUNCE * 2**failures)
+                continue
+            # Don't keep showing settings that never reached the disk
+            unsaved = ", ".join(
+                f"{section}.{key}={value}" for (section, key), value in pending_options.items()
+            )
+            pending_options.clear()
+            logger.error(
+                "Could not save settings after %s attempts, reverting to the config file: %s",
+                SAVE_MAX_ATTEMPTS,
+                unsaved,
+            )
+            failures = 0
+            snapshot = await asyncio.to_thread(cfg.read_config)
+            if snapshot is not None:
+                cfg.apply_config(snapshot)
+        # The save swapped in a snapshot built before any toggle made meanwhile; re-stage those
+        if pending_options:
+            cfg.stage_options(
+                [(section, key, value) for (section, key), value in pending_options.items()]
+            )
+
+
+async def watch_config(interval: float = 1.0):
+    """Background task that hot-reloads the config when a config file changes."""
+    while True:
+        await asyncio.sleep(interval)
+        if cfg.config_changed():
+            logger.info("Config file change detected. Reloading...")
+            # Read and parse in a worker thread, then swap on the event loop
+            snapshot = await asyncio.to_thread(cfg.read_config)
+            if snapshot is not None:
+                cfg.apply_config(snapshot)
 
 
 async def post_init(application: Application):
-    """Sets the bot commands for autocomplete and recovers pending reminders."""
+    """Sets the bot commands, recovers pending reminders and starts the background tasks."""
     # 1. Autocomplete Commands
     commands = [
         BotCommand("start", "Welcome message & initialization"),
@@ -1539,17 +2215,14 @@ async def post_init(application: Application):
     await application.bot.set_my_commands(commands)
 
     # 2. Recover Reminders from DB
-    pending = db.get_pending_reminders()
-    now = datetime.now(timezone.utc)
+    pending = await db.a_get_pending_reminders()
+    now = time.time()
     count = 0
+    overdue = []
 
     for row in pending:
-        remind_time = datetime.fromisoformat(row["remind_time"])
-        if remind_time.tzinfo is None:
-            remind_time = remind_time.replace(tzinfo=timezone.utc)
+        due = row["remind_epoch"]
 
-        seconds = (remind_time - now).total_seconds()
-        
         job_data = {
             "reminder_id": row["id"],
             "chat_id": row["chat_id"],
@@ -1559,21 +2232,23 @@ async def post_init(application: Application):
             "link": row["link"],
         }
 
-        if seconds <= 0:
+        if due <= now:
             # Overdue while bot was down, send immediately
-            asyncio.create_task(send_reminder_from_recovery(application.bot, job_data))
+            overdue.append(job_data)
         else:
             # Re-schedule
-            context_stub = type('obj', (object,), {'bot': application.bot})
-            asyncio.create_task(schedule_reminder(context_stub, int(seconds), job_data))
+            schedule_reminder(due, job_data)
         
         count += 1
     
+    if overdue:
+        spawn(send_reminders(application.bot, overdue, send_reminder_from_recovery))
+
     if count > 0:
-        logger.info(f"Recovered {count} reminders from database.")
+        logger.info("Recovered %d reminders from database (%d overdue).", count, len(overdue))
 
     # 3. Check for restart announcement
-    restart_chat_id = db.get_state("restart_chat_id")
+    restart_chat_id = await db.a_get_state("restart_chat_id")
     if restart_chat_id:
         try:
             await application.bot.send_message(
@@ -1584,11 +2259,32 @@ async def post_init(application: Application):
         except Exception as e:
             logger.error(f"Failed to send restart announcement: {e}")
         finally:
-            db.clear_state("restart_chat_id")
+            await db.a_clear_state("restart_chat_id")
+
+    # 4. Watch config files for hot reload
+    spawn(watch_config())
+
+    # 5. Send reminders as they fall due
+    spawn(reminder_worker(application.bot))
+
+    # 6. Start the outbound sender workers
+    for _ in range(SEND_WORKERS):
+        spawn(sender_worker(application.bot))
+
 
+async def post_shutdown(application: Application):
+    """Writes any settings still waiting on the debounce, then stops the background tasks."""
+    # The flush would otherwise be dropped mid-sleep, losing a toggle made just before stopping
+    if pending_save is not None:
+        await asyncio.wait([pending_save])
 
-async def send_reminder_from_recovery(bot, data):
-    """Helper to send overdue reminders on startup."""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+async def send_reminder_from_recovery(bot, data) -> bool:
+    """Helper to send overdue reminders on startup; returns True once delivered."""
     mention = f"<a href='tg://user?id={data['user_id']}'>Missed Reminder</a>"
     text = f"🔔 {mention} (Was scheduled for earlier)"
     if data["reason"]:
@@ -1603,31 +2299,54 @@ async def send_reminder_from_recovery(bot, data):
             reply_to_message_id=data["message_id"],
             parse_mode=ParseMode.HTML,
         )
-        db.delete_reminder(data["reminder_id"])
+        return True
     except Exception as e:
         logger.error(f"Failed to send recovered reminder: {e}")
+        return False
 
 
 def main():
     if not cfg.token:
         return
 
-    # 1. Configure Request with stable timeouts and HTTP/1.1
-    # This forces the bot to use HTTP/1.1 (more stable on some networks) and waits 60s for connections
-    request = HTTPXRequest(
-        connection_pool_size=8,
-        connect_timeout=60,
-        read_timeout=60,
-        write_timeout=60,
-        http_version="1.1",  # Force HTTP/1.1 to avoid HTTP/2 stream errors
-    )
+    # 0. Use the libuv-based event loop when it's installed (not available on Windows)
+    try:
+        import uvloop
+
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        logger.info("Using uvloop event loop.")
+    except ImportError:
+        pass
+
+    # 1. Configure Request with stable timeouts
+    # HTTP/1.1 is the default (more stable on some networks); HTTP/2 multiplexes sends over one connection
+    # Pooled connections stay alive between sends; a short connect timeout hands a dead
+    # network to deliver()'s backoff quickly instead of stalling a sender for a minute
+    s = cfg.settings
+    request_kwargs = {
+        "connection_pool_size": s.connection_pool_size,
+        "connect_timeout": 10,
+        "read_timeout": 60,
+        "write_timeout": 60,
+        "pool_timeout": 10,
+    }
+    try:
+        request = HTTPXRequest(http_version=s.http_version, **request_kwargs)
+    except (ImportError, RuntimeError) as e:
+        # HTTP/2 needs the optional h2 package (python-telegram-bot[http2])
+        logger.warning(f"HTTP/{s.http_version} unavailable, falling back to HTTP/1.1: {e}")
+        request = HTTPXRequest(http_version="1.1", **request_kwargs)
 
     # 2. Build Application with the custom request
+    # Updates are handled concurrently so a slow command (DB, Bot API) doesn't hold up the
+    # rest; handle_message never awaits before queueing a rewrite, so replies keep their order
     application = (
         Application.builder()
         .token(cfg.token)
         .request(request)
+        .concurrent_updates(True)
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
@@ -1658,6 +2377,11 @@ def main():
     # bootstrap_retries=-1 means it will keep trying to connect forever at startup if internet is down
     application.run_polling(allowed_updates=Update.ALL_TYPES, bootstrap_retries=-1)
 
+    # 5. Restart in place: replace this process with a fresh interpreter, same command line
+    if application.bot_data.get("restart_requested"):
+        logger.info("Restarting process...")
+        os.execv(sys.executable, sys.orig_argv)
+
 
 if __name__ == "__main__":
     main()